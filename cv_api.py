@@ -0,0 +1,221 @@
+""" Shared client for the Common Voice bucket/downloaders API"""
+
+
+import calendar
+import functools
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_API_URL = "https://commonvoice.mozilla.org/api/v1"
+
+# the bucket endpoint answers with the bare bucket host when it fails to sign a bundle URL
+_UNSIGNED_BUNDLE_URL = "https://s3.dualstack.us-west-2.amazonaws.com/"
+
+# used when a signed URL carries no recognizable expiry parameters
+_DEFAULT_URL_TTL = 10 * 60
+# refresh signed URLs this many seconds before they actually expire
+_URL_EXPIRY_MARGIN = 60
+
+logger = logging.getLogger(__name__)
+
+
+class _RetryableError(ConnectionError):
+    """A failed request that may succeed when sent again."""
+
+
+def _signed_url_expiry(url, now=None):
+    """Returns the unix time at which a signed bundle URL stops being valid."""
+    now = time.time() if now is None else now
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    try:
+        for prefix in ("X-Amz", "X-Goog"):
+            if f"{prefix}-Expires" in query and f"{prefix}-Date" in query:
+                signed_at = time.strptime(query[f"{prefix}-Date"][0], "%Y%m%dT%H%M%SZ")
+                return calendar.timegm(signed_at) + int(query[f"{prefix}-Expires"][0])
+        if "Expires" in query:
+            return int(query["Expires"][0])
+    except ValueError:
+        pass
+    return now + _DEFAULT_URL_TTL
+
+
+@functools.lru_cache(maxsize=None)
+def whoami(auth_token):
+    """Returns the Hugging Face account info for `auth_token`, cached for the lifetime of the process."""
+    from huggingface_hub import HfApi
+
+    return HfApi().whoami(auth_token)
+
+
+class CommonVoiceClient:
+    """Thread-safe client for the Common Voice API backed by a pooled `requests.Session`.
+
+    Failed GET requests are retried with exponential backoff and full jitter, signed bundle URLs are cached
+    until shortly before they expire and downloader logs can be queued and sent in one concurrent batch.
+    Every failure is raised as a `ConnectionError`.
+    """
+
+    def __init__(
+        self,
+        api_url=_API_URL,
+        max_retries=5,
+        backoff_factor=1.0,
+        max_backoff=30.0,
+        timeout=10.0,
+        max_workers=16,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._url_cache = {}
+        self._pending_logs = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.flush_download_logs()
+        self.session.close()
+
+    def _sleep_before_retry(self, attempt):
+        delay = min(self.max_backoff, self.backoff_factor * 2**attempt)
+        time.sleep(random.uniform(0, delay))
+
+    def _send(self, method, url, **kwargs):
+        """Sends a single request and returns its decoded JSON body.
+
+        Every failure is raised as a `ConnectionError`; the ones worth another attempt as `_RetryableError`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(f"{method} {url} failed: {e}") from e
+        except requests.RequestException as e:
+            raise ConnectionError(f"{method} {url} failed: {e}") from e
+        if response.status_code >= 500 or response.status_code == 429:
+            raise _RetryableError(f"{method} {url} failed with status {response.status_code}")
+        if not response.ok:
+            raise ConnectionError(f"{method} {url} failed with status {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ConnectionError(f"{method} {url} returned an invalid JSON body") from e
+
+    def _request(self, method, url, retry=True, validate=None, **kwargs):
+        """Sends a request, retrying `_RetryableError`s with exponential backoff and full jitter.
+
+        `validate` is called on the decoded body and may raise `_RetryableError` itself, so that retries for bad
+        results share the budget of retries for failed requests.
+        """
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                result = self._send(method, url, **kwargs)
+                if validate is not None:
+                    validate(result)
+                return result
+            except _RetryableError as e:
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"{e}. Retrying ({attempt + 1}/{self.max_retries})... ")
+                self._sleep_before_retry(attempt)
+
+    def get_bundle_url(self, locale, url_template, refresh=False):
+        """Returns a signed download URL for the `locale` bundle, reusing a cached one while it is valid.
+
+        Pass `refresh=True` to always sign a new URL, e.g. right before a long download that must not outlive it.
+        """
+        path = url_template.replace("{locale}", locale)
+        path = urllib.parse.quote(path.encode("utf-8"), safe="~()*!.'")
+
+        with self._lock:
+            cached = self._url_cache.get(path)
+        if not refresh and cached is not None and cached[1] - _URL_EXPIRY_MARGIN > time.time():
+            return cached[0]
+
+        def validate(response):
+            if not isinstance(response, dict) or "url" not in response:
+                raise ConnectionError(f"Cannot download '{locale.upper()}' data, no url in response: {response}. ")
+            if response["url"] == _UNSIGNED_BUNDLE_URL:
+                raise _RetryableError(f"Cannot download '{locale.upper()}' data, fetched url: {response['url']}. ")
+
+        url = self._request("GET", f"{self.api_url}/bucket/dataset/{path}", validate=validate)["url"]
+        with self._lock:
+            self._url_cache[path] = (url, _signed_url_expiry(url))
+        return url
+
+    def get_bundle_urls(self, locales, url_template):
+        """Resolves the bundle URLs of many locales concurrently.
+
+        Returns a dict mapping each locale to its URL, or to the exception raised while resolving it.
+        """
+
+        def resolve(locale):
+            try:
+                return self.get_bundle_url(locale, url_template)
+            except ConnectionError as e:
+                return e
+
+        locales = list(locales)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(locales, executor.map(resolve, locales)))
+
+    def log_download(self, locale, bundle_version, email=""):
+        """Records a download of `locale`. Not retried, since a resent POST would be counted twice."""
+        payload = {"email": email, "locale": locale, "dataset": bundle_version}
+        return self._request("POST", f"{self.api_url}/{locale}/downloaders", retry=False, json=payload)
+
+    def queue_download_log(self, locale, bundle_version, email=""):
+        """Queues a downloader log to be sent with the next `flush_download_logs` call."""
+        with self._lock:
+            self._pending_logs.append((locale, bundle_version, email))
+
+    def flush_download_logs(self):
+        """Sends all queued downloader logs concurrently. Failures are logged, not raised."""
+        with self._lock:
+            pending, self._pending_logs = self._pending_logs, []
+        if not pending:
+            return
+
+        def send(args):
+            try:
+                self.log_download(*args)
+            except ConnectionError as e:
+                logger.warning(f"Failed to log download of '{args[0].upper()}': {e}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(send, pending))
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns a process-wide `CommonVoiceClient` so that all callers share one connection pool."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = CommonVoiceClient()
+        return _default_client
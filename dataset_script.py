@@ -17,16 +17,18 @@
 
 import csv
 import os
-import urllib
 
 import datasets
-import requests
 from datasets.utils.py_utils import size_str
-from huggingface_hub import HfApi, HfFolder
+from huggingface_hub import HfFolder
 
+from .cv_api import get_client, whoami
 from .languages import LANGUAGES
 from .release_stats import STATS
 
+
+logger = datasets.logging.get_logger(__name__)
+
 _CITATION = """\
 @inproceedings{commonvoice:2020,
   author = {Ardila, R. and Branson, M. and Davis, K. and Henretty, M. and Kohler, M. and Meyer, J. and Morais, R. and Saunders, L. and Tyers, F. M. and Weber, G.},
@@ -41,8 +43,6 @@ _HOMEPAGE = "https://commonvoice.mozilla.org/en/datasets"
 
 _LICENSE = "https://creativecommons.org/publicdomain/zero/1.0/"
 
-_API_URL = "https://commonvoice.mozilla.org/api/v1"
-
 
 class CommonVoiceConfig(datasets.BuilderConfig):
     """BuilderConfig for CommonVoice."""
@@ -127,21 +127,18 @@ class CommonVoice(datasets.GeneratorBasedBuilder):
         )
 
     def _get_bundle_url(self, locale, url_template):
-        # path = encodeURIComponent(path)
-        path = url_template.replace("{locale}", locale)
-        path = urllib.parse.quote(path.encode("utf-8"), safe="~()*!.'")
-        # use_cdn = self.config.size_bytes < 20 * 1024 * 1024 * 1024
-        # response = requests.get(f"{_API_URL}/bucket/dataset/{path}/{use_cdn}", timeout=10.0).json()
-        response = requests.get(f"{_API_URL}/bucket/dataset/{path}", timeout=10.0).json()
-        return response["url"]
+        return get_client().get_bundle_url(locale, url_template)
 
     def _log_download(self, locale, bundle_version, auth_token):
         if isinstance(auth_token, bool):
             auth_token = HfFolder().get_token()
-        whoami = HfApi().whoami(auth_token)
-        email = whoami["email"] if "email" in whoami else ""
-        payload = {"email": email, "locale": locale, "dataset": bundle_version}
-        requests.post(f"{_API_URL}/{locale}/downloaders", json=payload).json()
+        user_info = whoami(auth_token)
+        email = user_info["email"] if "email" in user_info else ""
+        try:
+            get_client().log_download(locale, bundle_version, email)
+        except ConnectionError as e:
+            # logging the download must not block access to the data
+            logger.warning(f"Failed to log the download of '{locale}': {e}")
 
     def _split_generators(self, dl_manager):
         """Returns SplitGenerators."""
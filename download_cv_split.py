@@ -1,6 +1,4 @@
-import urllib
 import sys
-import requests
 import os
 import logging
 import shutil
@@ -10,6 +8,8 @@ import time
 from pathlib import Path
 from datasets.download import DownloadConfig, DownloadManager
 
+from cv_api import CommonVoiceClient
+
 
 logging.basicConfig(
     format='%(asctime)s %(levelname)s: %(message)s',
@@ -23,36 +23,25 @@ logging.basicConfig(
 #Step 1: Update the BUNDLE URL -> You can get this by trying to manually download a split and looking for the download URL.
 _BUNDLE_URL_TEMPLATE_DELTA = 'cv-corpus-13.0-2023-03-09/cv-corpus-13.0-2023-03-09-{locale}.tar.gz'
 _BUNDLE_VERSION = _BUNDLE_URL_TEMPLATE_DELTA.split("/")[0]
-_API_URL = "https://commonvoice.mozilla.org/api/v1"
+_DOWNLOADER_EMAIL = "vaibhav@huggingface.co"
 
 #Step 2: Place the path to the CV release JSON from https://github.com/common-voice/cv-dataset/tree/main/datasets
 _CV_DATASET_RELEASE_JSON = "cv-corpus-13.0-2023-03-09.json"
 
-def _get_bundle_url(locale, url_template):
-    path = url_template.replace("{locale}", locale)
-    path = urllib.parse.quote(path.encode("utf-8"), safe="~()*!.'")
-    response = requests.get(f"{_API_URL}/bucket/dataset/{path}", timeout=10.0).json()
-    return response["url"]
-
-
-def _log_download(locale, bundle_version):
-    email = "vaibhav@huggingface.co"
-    payload = {"email": email, "locale": locale, "dataset": bundle_version}
-    requests.post(f"{_API_URL}/{locale}/downloaders", json=payload).json()
+def prefetch_bundle_urls(client, languages):
+    """Resolves the signed bundle URLs of all `languages` up front, concurrently, to report failures early."""
+    urls = client.get_bundle_urls(languages, _BUNDLE_URL_TEMPLATE_DELTA)
+    for lang, url in urls.items():
+        if isinstance(url, Exception):
+            logging.warning(f"Could not prefetch data url for '{lang.upper()}': {url}")
 
 
-def download_language(dl_manager, lang, root_dir):
-    _log_download(lang, _BUNDLE_VERSION)
-    url = _get_bundle_url(lang, _BUNDLE_URL_TEMPLATE_DELTA)
-    i = 1
-    while url == "https://s3.dualstack.us-west-2.amazonaws.com/":
-        if i == 6:
-            raise ConnectionError(f"Cannot download '{lang.upper()}' data, fetched url: {url}. ")
-        i += 1
-        logging.warning(f"Unsuccessful attempt to fetch data url. Trying {i} time. ")
-        time.sleep(15)
-        _log_download(lang, _BUNDLE_VERSION)
-        url = _get_bundle_url(lang, _BUNDLE_URL_TEMPLATE_DELTA)
+def download_language(client, dl_manager, lang, root_dir):
+    # only logged once the locale is actually attempted, and sent before its download starts
+    client.queue_download_log(lang, _BUNDLE_VERSION, _DOWNLOADER_EMAIL)
+    client.flush_download_logs()
+    # downloads can take hours, so sign a fresh URL instead of reusing the prefetched one
+    url = client.get_bundle_url(lang, _BUNDLE_URL_TEMPLATE_DELTA, refresh=True)
 
     logging.info(f"Trying to download data for '{lang.upper()}'... ")
     path = dl_manager.download_and_extract(url)
@@ -85,19 +74,22 @@ def main():
         record_checksums=False,
     )
 
-    for lang_id, lang in enumerate(tqdm(languages, desc="Processing languages...")):
-        if lang in langs_to_skip:
-            logging.info(f"Data for '{lang.upper()}' language already downloaded, skipping it. ")
-            continue
-        try:
-            download_language(dl_manager, lang, root_dir=root_dir)
-            with open(root_dir / "langs_ok.txt", "a") as f:
-                f.write(f"{lang_id}_{lang}\n")
-        except ConnectionError as e:
-            logging.error(e.strerror)
-            with open(root_dir / "langs_failed.txt", "a") as f:
-                f.write(f"{lang_id}_{lang}\n")
-        time.sleep(10)
+    with CommonVoiceClient() as client:
+        prefetch_bundle_urls(client, [lang for lang in languages if lang not in langs_to_skip])
+
+        for lang_id, lang in enumerate(tqdm(languages, desc="Processing languages...")):
+            if lang in langs_to_skip:
+                logging.info(f"Data for '{lang.upper()}' language already downloaded, skipping it. ")
+                continue
+            try:
+                download_language(client, dl_manager, lang, root_dir=root_dir)
+                with open(root_dir / "langs_ok.txt", "a") as f:
+                    f.write(f"{lang_id}_{lang}\n")
+            except ConnectionError as e:
+                logging.error(e)
+                with open(root_dir / "langs_failed.txt", "a") as f:
+                    f.write(f"{lang_id}_{lang}\n")
+            time.sleep(10)
 
 
 if __name__ == "__main__":
@@ -148,6 +148,7 @@ def main():
             fout.write("LANGUAGES = " + str(language_names))
 
         shutil.copy("dataset_script.py", f"{dataset_path}/{dataset_path}.py")
+        shutil.copy("cv_api.py", f"{dataset_path}/cv_api.py")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import cv_api
+from cv_api import CommonVoiceClient, _signed_url_expiry
+
+_TEMPLATE = "cv-corpus-test/cv-corpus-test-{locale}.tar.gz"
+_LATENCY = 0.2
+
+
+def _amz_url(locale, expires=3600):
+    signed_at = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    return f"https://bucket/{locale}.tar.gz?X-Amz-Date={signed_at}&X-Amz-Expires={expires}"
+
+
+class _MockAPI(BaseHTTPRequestHandler):
+    """Mock bucket/downloaders API. The locale prefix selects the behaviour of the bundle URL endpoint."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        locale = self.path.rsplit("-", 1)[-1][: -len(".tar.gz")]
+        with self.server.lock:
+            self.server.gets[locale] = attempt = self.server.gets.get(locale, 0) + 1
+        time.sleep(_LATENCY)
+
+        if locale.startswith("flaky") and attempt == 1:
+            return self._reply(503, {})
+        if locale.startswith("throttled") and attempt == 1:
+            return self._reply(429, {})
+        if locale.startswith("missing"):
+            return self._reply(404, {})
+        if locale.startswith("unsigned") and (locale == "unsigned_forever" or attempt <= 2):
+            return self._reply(200, {"url": cv_api._UNSIGNED_BUNDLE_URL})
+        if locale.startswith("shortlived"):
+            return self._reply(200, {"url": _amz_url(locale, expires=30)})
+        self._reply(200, {"url": _amz_url(locale)})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.posts.append(payload)
+        if payload["locale"] == "broken":
+            return self._reply(500, {})
+        self._reply(200, {})
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockAPI)
+    server.lock = threading.Lock()
+    server.gets = {}
+    server.posts = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    with CommonVoiceClient(
+        api_url=f"http://127.0.0.1:{server.server_port}", backoff_factor=0.01, max_workers=32
+    ) as client:
+        yield client
+
+
+def test_signed_url_expiry():
+    assert _signed_url_expiry("https://b/x?X-Amz-Date=20230309T120000Z&X-Amz-Expires=600") == 1678363800
+    assert _signed_url_expiry("https://b/x?X-Goog-Date=20230309T120000Z&X-Goog-Expires=600") == 1678363800
+    assert _signed_url_expiry("https://b/x?Expires=1678363800&Signature=abc") == 1678363800
+    assert _signed_url_expiry("https://b/x?X-Amz-Date=garbage&X-Amz-Expires=600", now=100) == 100 + cv_api._DEFAULT_URL_TTL
+    assert _signed_url_expiry("https://b/x", now=100) == 100 + cv_api._DEFAULT_URL_TTL
+
+
+def test_get_bundle_urls_resolves_many_locales_concurrently(server, client):
+    locales = [f"l{i}" for i in range(120)]
+
+    start = time.time()
+    urls = client.get_bundle_urls(locales, _TEMPLATE)
+    elapsed = time.time() - start
+
+    # resolving them one by one would take at least 120 * _LATENCY = 24 seconds
+    assert elapsed < 5
+    assert all(urls[locale].startswith(f"https://bucket/{locale}.tar.gz?") for locale in locales)
+    assert server.gets == {locale: 1 for locale in locales}
+
+    # signed URLs are served from the cache while they are valid
+    assert client.get_bundle_urls(locales, _TEMPLATE) == urls
+    assert sum(server.gets.values()) == 120
+
+
+def test_get_bundle_url_refetches_expiring_url(server, client):
+    client.get_bundle_url("shortlived", _TEMPLATE)
+    client.get_bundle_url("shortlived", _TEMPLATE)
+    assert server.gets["shortlived"] == 2
+
+
+def test_get_bundle_url_refresh_skips_cache(server, client):
+    client.get_bundle_url("en", _TEMPLATE)
+    client.get_bundle_url("en", _TEMPLATE)
+    assert server.gets["en"] == 1
+
+    client.get_bundle_url("en", _TEMPLATE, refresh=True)
+    assert server.gets["en"] == 2
+
+
+@pytest.mark.parametrize("locale", ["flaky", "throttled"])
+def test_get_bundle_url_retries_server_errors(server, client, locale):
+    assert client.get_bundle_url(locale, _TEMPLATE).startswith(f"https://bucket/{locale}")
+    assert server.gets[locale] == 2
+
+
+def test_get_bundle_url_does_not_retry_client_errors(server, client):
+    with pytest.raises(ConnectionError, match="404"):
+        client.get_bundle_url("missing", _TEMPLATE)
+    assert server.gets["missing"] == 1
+
+
+def test_get_bundle_url_retries_unsigned_url_within_one_budget(server, client):
+    assert client.get_bundle_url("unsigned", _TEMPLATE).startswith("https://bucket/unsigned")
+    assert server.gets["unsigned"] == 3
+
+    with pytest.raises(ConnectionError, match="UNSIGNED_FOREVER"):
+        client.get_bundle_url("unsigned_forever", _TEMPLATE)
+    assert server.gets["unsigned_forever"] == client.max_retries + 1
+
+
+def test_get_bundle_urls_returns_errors(server, client):
+    urls = client.get_bundle_urls(["ok", "missing"], _TEMPLATE)
+    assert urls["ok"].startswith("https://bucket/ok")
+    assert isinstance(urls["missing"], ConnectionError)
+
+
+def test_log_download_is_not_retried(server, client):
+    with pytest.raises(ConnectionError, match="500"):
+        client.log_download("broken", "cv-corpus-test")
+    assert len(server.posts) == 1
+
+
+def test_flush_download_logs_sends_queued_logs_once(server, client):
+    for locale in ["en", "broken", "fr"]:
+        client.queue_download_log(locale, "cv-corpus-test", "user@example.com")
+    assert server.posts == []
+
+    client.flush_download_logs()
+    client.flush_download_logs()
+    assert sorted(post["locale"] for post in server.posts) == ["broken", "en", "fr"]
+    assert all(post == {"email": "user@example.com", "locale": post["locale"], "dataset": "cv-corpus-test"}
+               for post in server.posts)